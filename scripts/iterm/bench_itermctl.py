@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# Cold-start benchmark for itermctl, runs anywhere using the iterm2 stub in ./stub
+# :: fails (exit 1) if importing itermctl takes longer than the budget,
+# :: or if iterm2 gets imported for the `test` action or for an argument error
+# :: also compares newtab/newwindow latency with and without the SessionPool, with simulated shell startup
+# :: import time includes compiling itermctl, since it always runs as a script and never gets a cached .pyc
+# :: usage: python scripts/iterm/bench_itermctl.py [--budget-ms 25] [--runs 10]
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser, Namespace
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+ITERMCTL = HERE / "itermctl.py"
+STUB_DIR = HERE / "stub"
+
+
+def parse() -> Namespace:
+    parser = ArgumentParser()
+    parser.add_argument("--budget-ms", type=float, default=25.0, help="import-time budget for itermctl")
+    parser.add_argument("--runs", type=int, default=10, help="number of runs per measurement")
+    parser.add_argument("--startup-ms", type=float, default=100.0, help="simulated shell startup time of a new session")
+    return parser.parse_args()
+
+
+def env(trace: Path) -> dict:
+    return {
+        **os.environ,
+        "PYTHONPATH": f"{STUB_DIR}{os.pathsep}{HERE}",
+        "PYTHONDONTWRITEBYTECODE": "1",
+        "ITERM2_STUB_TRACE": str(trace),
+    }
+
+
+def import_time_ms(trace: Path) -> float:
+    """Cumulative time to import itermctl, as reported by -X importtime."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import itermctl"],
+        env=env(trace),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|\s+itermctl$", line)
+        if match:
+            return int(match.group(1)) / 1000
+    raise RuntimeError(f"itermctl not found in import times:\n{result.stderr}")
+
+
+def imports_iterm2(argv: list, trace: Path) -> bool:
+    """Run itermctl with argv and report whether it imported iterm2."""
+    trace.write_text("")
+    subprocess.run([sys.executable, str(ITERMCTL), *argv], env=env(trace), capture_output=True)
+    return trace.read_text() != ""
+
+
+def pool_latency_ms(runs: int, startup_ms: float) -> dict:
+    """Median newtab/newwindow latency with and without a SessionPool, against the stub."""
+    import asyncio
+
+    os.environ["ITERM2_STUB_STARTUP"] = str(startup_ms / 1000)
+    sys.path[:0] = [str(STUB_DIR), str(HERE)]
+    import iterm2
+    import itermserve
+
+    async def measure() -> dict:
+        app = iterm2.App()
+        pool = itermserve.SessionPool(app, size=2)
+        maintainer = asyncio.get_running_loop().create_task(pool.maintain())
+        cases = {
+            "newtab": lambda: app.current_terminal_window.async_create_tab(),
+            "newtab (pool)": pool.newtab,
+            "newwindow": app.async_create_window,
+            "newwindow (pool)": pool.newwindow,
+        }
+        results = {}
+        for name, action in cases.items():
+            times = []
+            for _ in range(runs):
+                # let the pool refill, as it would between keystrokes
+                await asyncio.sleep(startup_ms / 1000 * 3)
+                await app.windows[0].async_activate()
+                start = time.perf_counter()
+                await action()
+                times.append((time.perf_counter() - start) * 1000)
+            results[name] = statistics.median(times)
+        maintainer.cancel()
+        return results
+
+    return asyncio.run(measure())
+
+
+def main() -> int:
+    args = parse()
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        trace = Path(tmp) / "iterm2-imports"
+
+        times = [import_time_ms(trace) for _ in range(args.runs)]
+        best, median = min(times), statistics.median(times)
+        print(f"import itermctl: best {best:.2f} ms, median {median:.2f} ms (budget {args.budget_ms:.2f} ms)")
+        if best > args.budget_ms:
+            failures.append(f"import time {best:.2f} ms exceeds budget {args.budget_ms:.2f} ms")
+
+        for argv in (["test"], ["setcolor", "9"], ["nope"], []):
+            imported = imports_iterm2(argv, trace)
+            print(f"itermctl {' '.join(argv) or '(no args)'}: {'imports' if imported else 'does not import'} iterm2")
+            if imported:
+                failures.append(f"itermctl {' '.join(argv)} imported iterm2")
+
+    for name, ms in pool_latency_ms(args.runs, args.startup_ms).items():
+        print(f"{name}: median {ms:.2f} ms (shell startup {args.startup_ms:.0f} ms)")
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,14 +7,54 @@
 # :: install with `pip install iterm2`
 # :: you will also need to enable python API in iterm2 settings, and install the python runtime (scripts > manager> install runtime)
 # :: finally, set "allow all apps to connect" (under "magic" in the settings)
-import subprocess
+# :: profile an invocation with `--profile` or ITERMCTL_PROFILE=1,
+# :: then merge the profiles with `keybindstate profile-report --script itermctl`
+# :: iterm2 (protobuf, websockets, ...) is only imported once an action needs a connection,
+# :: keep it that way: bench_itermctl.py enforces an import-time budget
+# :: `itermctl serve` keeps a resident connection that the other actions are sent to when it is running,
+# :: with a pool of pre-created sessions handed out by newtab/newwindow (see itermserve.py, only imported by serve)
+import os
+import sys
+import time
 from argparse import ArgumentParser, Namespace
+from contextlib import contextmanager, nullcontext
 
-import iterm2
+PROFILE_ENV = "ITERMCTL_PROFILE"
+PROFILE_DIR = os.path.expanduser("~/.local/state/profiles/itermctl")
+PROFILE_KEEP = 500
+SOCKET_PATH = os.path.expanduser("~/.local/state/itermctl.sock")
+
+
+# profiling_enabled and profile are copied verbatim from keybindstate.py, this script is standalone;
+# keep the copies identical, `keybindstate profile-report` depends on the file naming and rotation
+def profiling_enabled() -> bool:
+    # checked before argument parsing, so argparse construction shows up in the profile
+    return os.environ.get(PROFILE_ENV, "") not in ("", "0") or "--profile" in sys.argv[1:2]
+
+
+@contextmanager
+def profile(directory: str, keep: int = PROFILE_KEEP):
+    """Profile the body into directory as <time_ns>-<pid>-<label>.prof, keeping the newest keep."""
+    import cProfile
+    from pathlib import Path
+
+    info = {"label": "run"}
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield info
+    finally:
+        profiler.disable()
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(path / f"{time.time_ns()}-{os.getpid()}-{info['label']}.prof")
+        for old in sorted(path.glob("*.prof"))[:-keep]:
+            old.unlink(missing_ok=True)
 
 
 def parse() -> Namespace:
     parser = ArgumentParser()
+    parser.add_argument("--profile", action="store_true", help=f"profile this invocation into {PROFILE_DIR}")
     # one subparser for each action, in case there are params
     subparsers = parser.add_subparsers(dest="action", required=True)
     subparsers.add_parser("vsplit")
@@ -24,12 +64,24 @@ def parse() -> Namespace:
     color_parser = subparsers.add_parser("setcolor")
     color_parser.add_argument("color_num", type=int, choices=[1, 2, 3, 4, 5])
     subparsers.add_parser("test")
+    serve_parser = subparsers.add_parser("serve")
+    serve_parser.add_argument("--pool-size", type=int, default=2, help="pre-created sessions to keep ready, 0 disables the pool")
+    serve_parser.add_argument("--max-age", type=float, default=3600.0, help="seconds before a pooled session is replaced, 0 keeps them forever")
 
     return parser.parse_args()
 
 
+def run(coro) -> None:
+    """Connect to iTerm2 and run coro with the connection."""
+    import iterm2
+
+    iterm2.run_until_complete(coro)
+
+
 async def vsplit(connection):
     print("something")
+    import iterm2
+
     app = await iterm2.async_get_app(connection)
     assert app is not None
     window = app.current_terminal_window
@@ -42,6 +94,8 @@ async def vsplit(connection):
 
 
 async def hsplit(connection):
+    import iterm2
+
     app = await iterm2.async_get_app(connection)
     assert app is not None
     window = app.current_terminal_window
@@ -54,6 +108,8 @@ async def hsplit(connection):
 
 
 async def newtab(connection):
+    import iterm2
+
     app = await iterm2.async_get_app(connection)
     assert app is not None
     window = app.current_terminal_window
@@ -62,22 +118,26 @@ async def newtab(connection):
 
 
 async def newwindow(connection):
+    import iterm2
+
     app = await iterm2.async_get_app(connection)
     assert app is not None
     await app.async_create_window()
 
 
-# Color definitions for tabs (RGB values 0-1)
+# Color definitions for tabs (RGB values 0-1), turned into iterm2.Color when used
 COLORS = {
-    1: iterm2.Color(1.0, 0.2, 0.2),  # Red
-    2: iterm2.Color(0.2, 0.8, 0.2),  # Green
-    3: iterm2.Color(0.2, 0.2, 1.0),  # Blue
-    4: iterm2.Color(1.0, 0.8, 0.2),  # Yellow/Orange
-    5: iterm2.Color(0.8, 0.2, 0.8),  # Magenta/Purple
+    1: (1.0, 0.2, 0.2),  # Red
+    2: (0.2, 0.8, 0.2),  # Green
+    3: (0.2, 0.2, 1.0),  # Blue
+    4: (1.0, 0.8, 0.2),  # Yellow/Orange
+    5: (0.8, 0.2, 0.8),  # Magenta/Purple
 }
 
 
 async def setcolor(connection, color_num: int):
+    import iterm2
+
     app = await iterm2.async_get_app(connection)
     assert app is not None
     window = app.current_terminal_window
@@ -86,22 +146,74 @@ async def setcolor(connection, color_num: int):
     assert tab is not None
     color = COLORS.get(color_num)
     if color:
-        await tab.async_set_tab_color(color)
+        await tab.async_set_tab_color(iterm2.Color(*color))
 
 
-if __name__ == "__main__":
-    args = parse()
-    if args.action == "vsplit":
-        iterm2.run_until_complete(vsplit)
-    elif args.action == "hsplit":
-        iterm2.run_until_complete(hsplit)
-    elif args.action == "newtab":
-        iterm2.run_until_complete(newtab)
-    elif args.action == "newwindow":
-        iterm2.run_until_complete(newwindow)
+ACTIONS = {
+    "vsplit": vsplit,
+    "hsplit": hsplit,
+    "newtab": newtab,
+    "newwindow": newwindow,
+}
+
+
+async def perform(connection, args: Namespace, pool=None) -> None:
+    """Perform a parsed action, taking new tabs/windows from pool when there is one."""
+    if pool is not None and args.action == "newtab":
+        await pool.newtab()
+    elif pool is not None and args.action == "newwindow":
+        await pool.newwindow()
     elif args.action == "setcolor":
-        async def setcolor_wrapper(connection):
-            await setcolor(connection, args.color_num)
-        iterm2.run_until_complete(setcolor_wrapper)
+        await setcolor(connection, args.color_num)
     else:
+        await ACTIONS[args.action](connection)
+
+
+def send(args: Namespace) -> bool:
+    """
+    Send an action to a running `itermctl serve`.
+    Returns False if there is none, it can't be reached, or it did not perform the action,
+    so the caller can perform the action itself.
+    """
+    import json
+    import socket
+
+    request = {k: v for k, v in vars(args).items() if k != "profile"}
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(5)
+            client.connect(SOCKET_PATH)
+            client.sendall(json.dumps(request).encode() + b"\n")
+            response = client.makefile().readline().strip()
+    except (FileNotFoundError, ConnectionRefusedError):
+        # no server, or a stale socket left by one that exited
+        return False
+    except OSError as e:
+        # timed out or reset: the server is hung or died mid-request
+        print(f"itermctl: server unavailable ({e}), connecting directly", file=sys.stderr)
+        return False
+    if response != "ok":
+        print(f"itermctl: server {response or 'gave no response'}, connecting directly", file=sys.stderr)
+        return False
+    return True
+
+
+def main(session: dict):
+    args = parse()
+    session["label"] = args.action
+    if args.action == "test":
         print("worked")
+    elif args.action == "serve":
+        import iterm2
+        import itermserve
+
+        iterm2.run_forever(
+            lambda connection: itermserve.serve(connection, perform, SOCKET_PATH, args.pool_size, args.max_age)
+        )
+    elif not send(args):
+        run(lambda connection: perform(connection, args))
+
+
+if __name__ == "__main__":
+    with profile(PROFILE_DIR) if profiling_enabled() else nullcontext({}) as session:
+        main(session)
@@ -0,0 +1,167 @@
+# Resident side of itermctl: `itermctl serve` imports this module, other actions never do,
+# :: so none of this counts against itermctl's import-time budget (see bench_itermctl.py)
+import os
+import sys
+import time
+from argparse import Namespace
+from collections import deque
+
+
+class SessionPool:
+    """
+    Sessions created ahead of time in a background window, handed out by newtab/newwindow
+    so they do not wait for shell startup. Refilled in the background after every handout.
+    Sessions older than max_age are closed and replaced, so pooled shells do not go stale.
+    Works against anything shaped like iterm2.App (see stub/iterm2.py).
+    """
+
+    def __init__(self, app, size: int = 2, max_age: float = 3600.0, clock=time.monotonic):
+        self.app = app
+        self.size = size
+        self.max_age = max_age
+        self.clock = clock
+        self._ready = deque()  # (created, tab_id), oldest first
+        self._window_id = None
+        self._wake = None
+
+    def __len__(self) -> int:
+        return len(self._ready)
+
+    @property
+    def window(self):
+        """The background window holding the pooled sessions, if it still exists."""
+        if self._window_id is None:
+            return None
+        return self.app.get_window_by_id(self._window_id)
+
+    def _stale(self, created: float) -> bool:
+        return self.max_age > 0 and self.clock() - created > self.max_age
+
+    async def evict(self) -> None:
+        """Drop sessions that were closed elsewhere or are older than max_age."""
+        keep = deque()
+        for created, tab_id in self._ready:
+            tab = self.app.get_tab_by_id(tab_id)
+            if tab is None:
+                continue
+            if self._stale(created):
+                await tab.async_close(force=True)
+                continue
+            keep.append((created, tab_id))
+        self._ready = keep
+
+    async def refill(self) -> None:
+        """Evict, then create sessions until the pool is full, without stealing focus."""
+        await self.evict()
+        while len(self._ready) < self.size:
+            previous = self.app.current_terminal_window
+            window = self.window
+            if window is None:
+                window = await self.app.async_create_window()
+                self._window_id = window.window_id
+                tab = window.current_tab
+            else:
+                tab = await window.async_create_tab()
+            self._ready.append((self.clock(), tab.tab_id))
+            current = self.app.current_terminal_window
+            if previous is not None and current is not None and current.window_id == self._window_id:
+                await previous.async_activate()
+
+    def refill_soon(self) -> None:
+        if self._wake is not None:
+            self._wake.set()
+
+    async def maintain(self) -> None:
+        """Keep the pool full, forever. Wakes on handouts and periodically to evict stale sessions."""
+        import asyncio
+
+        self._wake = asyncio.Event()
+        interval = self.max_age / 4 if self.max_age > 0 else None
+        while True:
+            try:
+                await self.refill()
+            except Exception as e:
+                print(f"itermctl: pool refill failed: {e}", file=sys.stderr)
+            try:
+                await asyncio.wait_for(self._wake.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _take(self):
+        """Hand out the oldest live session, closing stale ones on the way."""
+        while self._ready:
+            created, tab_id = self._ready.popleft()
+            tab = self.app.get_tab_by_id(tab_id)
+            if tab is None:
+                continue
+            if self._stale(created):
+                await tab.async_close(force=True)
+                continue
+            return tab
+        return None
+
+    def _is_last_in_pool_window(self, tab) -> bool:
+        window = self.window
+        return window is not None and [t.tab_id for t in window.tabs] == [tab.tab_id]
+
+    async def newtab(self) -> None:
+        window = self.app.current_terminal_window
+        tab = None
+        if window is not None and window.window_id != self._window_id:
+            tab = await self._take()
+        if tab is None:
+            if window is not None:
+                await window.async_create_tab()
+        else:
+            if self._is_last_in_pool_window(tab):
+                # the pool window closes once its last tab moves out
+                self._window_id = None
+            await window.async_set_tabs([*window.tabs, tab])
+            await tab.async_activate()
+        self.refill_soon()
+
+    async def newwindow(self) -> None:
+        tab = await self._take()
+        if tab is None:
+            await self.app.async_create_window()
+        elif self._is_last_in_pool_window(tab):
+            # the pool window holds only this session, hand out the window itself
+            window, self._window_id = self.window, None
+            await window.async_activate()
+        else:
+            window = await tab.async_move_to_window()
+            await window.async_activate()
+        self.refill_soon()
+
+
+async def serve(connection, perform, socket_path: str, pool_size: int, max_age: float) -> None:
+    """
+    Accept actions from other itermctl invocations on socket_path, one JSON line each,
+    and run them with perform(connection, args, pool).
+    """
+    import asyncio
+    import json
+
+    import iterm2
+
+    pool = None
+    if pool_size > 0:
+        pool = SessionPool(await iterm2.async_get_app(connection), size=pool_size, max_age=max_age)
+        asyncio.get_running_loop().create_task(pool.maintain())
+
+    async def handle(reader, writer):
+        try:
+            args = Namespace(**json.loads(await reader.readline()))
+            await perform(connection, args, pool)
+            writer.write(b"ok\n")
+        except Exception as e:
+            writer.write(f"error: {e}\n".encode())
+        await writer.drain()
+        writer.close()
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+    server = await asyncio.start_unix_server(handle, path=socket_path)
+    await server.serve_forever()
@@ -0,0 +1,154 @@
+# Local stand-in for the iterm2 package, for running itermctl without iTerm2 (e.g. on Linux)
+# :: put this directory first on PYTHONPATH to shadow the real package
+# :: ITERM2_STUB_TRACE, if set, is a file that gets one line appended when this module is imported
+# :: ITERM2_STUB_STARTUP, if set, is the simulated shell startup time (seconds) of a new session
+# :: only the parts of the API itermctl uses are modelled: one App with windows, tabs and sessions
+
+
+import asyncio
+import itertools
+import os
+
+if os.environ.get("ITERM2_STUB_TRACE"):
+    with open(os.environ["ITERM2_STUB_TRACE"], "a") as f:
+        f.write("imported\n")
+
+STARTUP_DELAY = float(os.environ.get("ITERM2_STUB_STARTUP", "0"))
+_ids = itertools.count(1)
+
+
+class Color:
+    def __init__(self, red: float, green: float, blue: float):
+        self.red = red
+        self.green = green
+        self.blue = blue
+
+
+class Connection:
+    pass
+
+
+class Session:
+    def __init__(self, tab):
+        self.session_id = f"session-{next(_ids)}"
+        self.tab = tab
+
+    async def async_split_pane(self, vertical: bool = False):
+        await asyncio.sleep(STARTUP_DELAY)
+        session = Session(self.tab)
+        self.tab.sessions.append(session)
+        return session
+
+
+class Tab:
+    def __init__(self, app, window):
+        self.tab_id = f"tab-{next(_ids)}"
+        self.app = app
+        self.window = window
+        self.sessions = [Session(self)]
+        self.color = None
+        self.closed = False
+
+    @property
+    def current_session(self):
+        return self.sessions[0]
+
+    async def async_set_tab_color(self, color):
+        self.color = color
+
+    async def async_activate(self, order_window_front: bool = True):
+        self.window.selected = self
+        if order_window_front:
+            await self.window.async_activate()
+
+    async def async_move_to_window(self):
+        window = Window(self.app, tabs=[])
+        self.app.windows.append(window)
+        self.window._remove(self)
+        window.tabs.append(self)
+        self.window = window
+        return window
+
+    async def async_close(self, force: bool = False):
+        self.closed = True
+        self.window._remove(self)
+
+
+class Window:
+    def __init__(self, app, tabs=None):
+        self.window_id = f"window-{next(_ids)}"
+        self.app = app
+        self.tabs = [Tab(app, self)] if tabs is None else tabs
+        self.selected = self.tabs[0] if self.tabs else None
+
+    @property
+    def current_tab(self):
+        return self.selected
+
+    def _remove(self, tab):
+        self.tabs.remove(tab)
+        if self.selected is tab:
+            self.selected = self.tabs[-1] if self.tabs else None
+        if not self.tabs:
+            # iTerm2 closes windows when their last tab goes away
+            self.app.windows.remove(self)
+            if self.app.current_terminal_window is self:
+                self.app.current_terminal_window = self.app.windows[-1] if self.app.windows else None
+
+    async def async_create_tab(self, profile=None):
+        await asyncio.sleep(STARTUP_DELAY)
+        tab = Tab(self.app, self)
+        self.tabs.append(tab)
+        self.selected = tab
+        return tab
+
+    async def async_set_tabs(self, tabs):
+        for tab in tabs:
+            if tab.window is not self:
+                tab.window._remove(tab)
+                tab.window = self
+        self.tabs = list(tabs)
+
+    async def async_activate(self):
+        self.app.current_terminal_window = self
+
+
+class App:
+    def __init__(self):
+        self.windows = [Window(self)]
+        self.current_terminal_window = self.windows[0]
+
+    async def async_create_window(self, profile=None):
+        await asyncio.sleep(STARTUP_DELAY)
+        window = Window(self)
+        self.windows.append(window)
+        self.current_terminal_window = window
+        return window
+
+    def get_window_by_id(self, window_id):
+        return next((w for w in self.windows if w.window_id == window_id), None)
+
+    def get_tab_by_id(self, tab_id):
+        return next((t for w in self.windows for t in w.tabs if t.tab_id == tab_id), None)
+
+
+_app = None
+
+
+async def async_get_app(connection):
+    global _app
+    if _app is None:
+        _app = App()
+    return _app
+
+
+def run_until_complete(coro):
+    return asyncio.run(coro(Connection()))
+
+
+def run_forever(coro):
+    async def forever():
+        await coro(Connection())
+        await asyncio.Event().wait()
+
+    asyncio.run(forever())
@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
+import bisect
 import json
 import logging
+import math
 import os
+import re
 import sys
+import threading
+import time
 from abc import abstractmethod
 from argparse import ArgumentParser, Namespace
+from collections import deque
 from collections.abc import Mapping, Sequence
-from contextlib import contextmanager, suppress
+from contextlib import contextmanager, nullcontext, suppress
 from pathlib import Path
 from typing import Any, Callable, Dict, List, Optional, Union
 
@@ -23,6 +29,124 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def _logaddexp2(a: float, b: float) -> float:
+    """log2(2**a + 2**b) without overflow."""
+    if a == -math.inf:
+        return b
+    if b == -math.inf:
+        return a
+    high, low = max(a, b), min(a, b)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+class AppIndex:
+    """
+    Index over known app names, answering prefix and fuzzy queries ranked by frecency.
+
+    The frecency of an app is the sum over its uses of 2 ** -(age / HALF_LIFE). It is kept
+    in log2 space relative to a fixed epoch (log2 of the sum of 2 ** (t / HALF_LIFE)), so
+    decay applies to every app equally, scores compare directly without being decayed,
+    and a use only updates its own entry. Lowercased names are kept sorted, so inserts and
+    prefix queries find their position by bisection.
+    """
+
+    HALF_LIFE = 3 * 24 * 3600
+
+    def __init__(
+        self,
+        scores: Optional[Dict[str, Optional[float]]] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.clock = clock
+        self._names: Dict[str, str] = {}
+        self._keys: List[str] = []
+        self._scores: Dict[str, float] = {}
+        for name, score in (scores or {}).items():
+            self._scores[self.add(name)] = -math.inf if score is None else score
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, name: str) -> bool:
+        return name.lower() in self._names
+
+    def add(self, name: str) -> str:
+        """
+        Add an app name if not known yet.
+
+        Returns:
+            The canonical name, which differs from name if it was first seen with other case.
+        """
+        key = name.lower()
+        if key in self._names:
+            return self._names[key]
+        self._names[key] = name
+        bisect.insort(self._keys, key)
+        self._scores[name] = -math.inf
+        return name
+
+    def canonical(self, name: str) -> Optional[str]:
+        """Get the known spelling of name, ignoring case."""
+        return self._names.get(name.lower())
+
+    def touch(self, name: str) -> None:
+        """Record a use of an app now."""
+        name = self.add(name)
+        self._scores[name] = _logaddexp2(self._scores[name], self.clock() / self.HALF_LIFE)
+
+    def score(self, name: str) -> float:
+        """Decayed frecency of an app as of now (1.0 for a single use just now)."""
+        score = self._scores.get(self.canonical(name) or name, -math.inf)
+        if score == -math.inf:
+            return 0.0
+        return 2 ** (score - self.clock() / self.HALF_LIFE)
+
+    def search(self, query: str, limit: int = 10) -> List[str]:
+        """
+        Find known apps matching query, best first.
+
+        Prefix matches come first. Only if they do not fill limit are the remaining apps
+        scanned for matches at the start of a word, then anywhere, then as a subsequence.
+        Within each group apps are ranked by frecency.
+        """
+        query = query.lower()
+        rank = lambda key: -self._scores[self._names[key]]
+
+        start = bisect.bisect_left(self._keys, query)
+        end = start
+        while end < len(self._keys) and self._keys[end].startswith(query):
+            end += 1
+        matches = sorted(self._keys[start:end], key=rank)
+
+        if len(matches) < limit:
+            rest = self._keys[:start] + self._keys[end:]
+            word_start, inside = [], []
+            for key in rest:
+                if query in key:
+                    (word_start if f" {query}" in f" {key}" else inside).append(key)
+            matches.extend(sorted(word_start, key=rank))
+            matches.extend(sorted(inside, key=rank))
+
+        if len(matches) < limit:
+            pattern = re.compile(".*?".join(map(re.escape, query)))
+            fuzzy = [key for key in rest if query not in key and pattern.search(key)]
+            matches.extend(sorted(fuzzy, key=rank))
+
+        return [self._names[key] for key in matches[:limit]]
+
+    def best(self, query: str) -> Optional[str]:
+        """Get the best match for query, if any."""
+        matches = self.search(query, limit=1)
+        return matches[0] if matches else None
+
+    def to_dict(self) -> Dict[str, Optional[float]]:
+        """Scores for JSON serialization, None for apps never used."""
+        return {
+            name: None if score == -math.inf else round(score, 6)
+            for name, score in self._scores.items()
+        }
+
+
 class AppState(Mapping[str, str], Sequence[str]):
     """
     A class that encapsulates app stack and mapping state, ensuring they stay in sync.
@@ -38,11 +162,16 @@ class AppState(Mapping[str, str], Sequence[str]):
         mapping: Optional[Dict[str, str]] = None,
         current_index: int = 0,
         on_current_changed: Callable[[str], None] = lambda _: None,
+        frecency: Optional[Dict[str, Optional[float]]] = None,
+        clock: Callable[[], float] = time.time,
     ):
         self._stack = list(stack) if stack is not None else []
         self._mapping = dict(mapping) if mapping is not None else {}
         self._current_index = current_index
         self._on_current_changed = on_current_changed
+        self._app_index = AppIndex(frecency, clock=clock)
+        for app in [*self._stack, *self._mapping.values()]:
+            self._app_index.add(app)
 
     # Sequence interface (for stack access)
     def __getitem__(self, key):
@@ -71,6 +200,7 @@ class AppState(Mapping[str, str], Sequence[str]):
             logger.debug(f"Set stack[{key}] = '{value}'")
         else:
             raise TypeError(f"Mapping keys must be str, got {type(key).__name__}")
+        self._app_index.add(value)
 
     def __delitem__(self, key: Union[str, int]) -> None:
         """
@@ -123,11 +253,18 @@ class AppState(Mapping[str, str], Sequence[str]):
 
     def insert(self, key: int, value: str):
         self._stack.insert(key, value)
+        self._app_index.add(value)
 
     def append(self, value: str):
         self._stack.append(value)
+        self._app_index.add(value)
         logger.debug(f"Appended app to stack: '{value}'")
 
+    @property
+    def app_index(self) -> AppIndex:
+        """Index of every app seen in the stack, mappings or reported by the platform."""
+        return self._app_index
+
     @property
     def current_index(self) -> int:
         """Get current index in stack."""
@@ -152,30 +289,47 @@ class AppState(Mapping[str, str], Sequence[str]):
 
     @current_app.setter
     def current_app(self, app: str):
-        if app in self._stack:
-            self.current_index = self.index(app)
-        else:
+        found = self.find_app_in_stack(app)
+        if found is None:
             self.append(app)
-            self.current_index = self.index(app)
+        elif found != app:
+            # Stored with other case (e.g. before names were canonicalized), keep one entry
+            self._stack[self._stack.index(found)] = app
+            logger.debug(f"Renamed app '{found}' in stack to '{app}'")
+        self.current_index = self.index(app)
+        self.record_use()
         logger.debug(f"Current app set to: {app}")
 
+    def record_use(self) -> None:
+        """
+        Credit the current app with a use in the frecency index.
+        Called once a switch is complete, not on every index change, so apps passed over
+        on the way (e.g. by prev) or re-selected by removals get no credit.
+        """
+        if self._stack:
+            self._app_index.touch(self.current_app)
+
     def next(self):
         self.current_index = (self.current_index + 1) % len(self._stack)
+        self.record_use()
         return self.current_app
 
     def prev(self):
         self.current_index = self.current_index - 1
         if self.current_index <= 0:
             self.current_index = len(self._stack) - 1 + self.current_index
+        self.record_use()
         return self.current_app
 
     def remove_from_stack(self, app: str) -> None:
-        """Internal helper: remove app from stack with index adjustment."""
-        if app not in self._stack:
+        """Internal helper: remove app from stack with index adjustment, matching case-insensitively."""
+        found = self.find_app_in_stack(app)
+        if found is None:
             logger.debug(
                 f"Attempted to remove app '{app}' from stack, but it's not in stack"
             )
             return
+        app = found
         old_index = self._stack.index(app)
         self._stack.remove(app)
         logger.debug(f"Removed app '{app}' from stack (was at index {old_index})")
@@ -261,23 +415,37 @@ class AppState(Mapping[str, str], Sequence[str]):
         self._mapping.clear()
         self._current_index = 0
 
-    def to_dict(self) -> Dict[str, Union[List[str], Dict[str, str], int]]:
+    def to_dict(self) -> Dict[str, Any]:
         """Convert to dict for JSON serialization."""
         return {
             "appstack": self._stack.copy(),
             "appindex": self._current_index,
             "appmapping": self._mapping.copy(),
+            "appfrecency": self._app_index.to_dict(),
         }
 
     @classmethod
-    def from_dict(cls, data: Dict[str, Any]) -> "AppState":
-        """Create from dict (e.g., from JSON)."""
+    def from_dict(
+        cls,
+        data: Dict[str, Any],
+        on_current_changed: Optional[Callable[[str], None]] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> "AppState":
+        """
+        Create from dict (e.g., from JSON).
+
+        Args:
+            data: Serialized state.
+            on_current_changed: Called with the new current app. If None, uses HOOKS.
+            clock: Time source for frecency scores.
+        """
         return cls(
             stack=data.get("appstack", []),
             mapping=data.get("appmapping", {}),
             current_index=data.get("appindex", 0),
-            # TODO: Support configuration of this
-            on_current_changed=PLATFORM.focus_app,
+            on_current_changed=on_current_changed or HOOKS,
+            frecency=data.get("appfrecency", {}),
+            clock=clock,
         )
 
     def save_to_file(self, path: Optional[Path] = None) -> None:
@@ -293,17 +461,24 @@ class AppState(Mapping[str, str], Sequence[str]):
         # Ensure parent directory exists
         path.parent.mkdir(parents=True, exist_ok=True)
 
-        # Serialize to JSON
+        # Serialize to JSON, replacing the file atomically so watchers never see a partial write
         state_dict = self.to_dict()
-        path.write_text(json.dumps(state_dict, indent=2))
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(state_dict, indent=2))
+        os.replace(tmp_path, path)
 
     @classmethod
-    def load_from_file(cls, path: Optional[Path] = None) -> "AppState":
+    def load_from_file(
+        cls,
+        path: Optional[Path] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> "AppState":
         """
         Load state from JSON file.
 
         Args:
             path: Path to load from. If None, uses DEFAULT_STATE_PATH.
+            clock: Time source for frecency scores.
 
         Returns:
             AppState instance loaded from file, or new instance if file doesn't exist.
@@ -313,19 +488,19 @@ class AppState(Mapping[str, str], Sequence[str]):
 
         if not path.exists():
             # Return new instance with defaults
-            instance = cls()
+            instance = cls(on_current_changed=HOOKS, clock=clock)
             instance.save_to_file(path)
             return instance
 
         # Load from file
         try:
             data = json.loads(path.read_text())
-            return cls.from_dict(data)
+            return cls.from_dict(data, clock=clock)
         except (json.JSONDecodeError, KeyError, ValueError) as e:
             # If file is corrupted, create new instance
             print(f"Warning: Error loading state from {path}: {e}", file=sys.stderr)
             print("Creating new state file.", file=sys.stderr)
-            instance = cls(on_current_changed=PLATFORM.focus_app)
+            instance = cls(on_current_changed=HOOKS, clock=clock)
             instance.save_to_file(path)
             return instance
 
@@ -350,22 +525,270 @@ def state(path: Optional[Path] = None):
     state_path = path or AppState.DEFAULT_STATE_PATH
     logger.debug(f"Loading state from {state_path}")
     app_state = AppState.load_from_file(path)
-    logger.debug(f"Loaded state: {app_state.to_dict()}")
+    loaded = app_state.to_dict()
+    logger.debug(f"Loaded state: {loaded}")
     try:
         yield app_state
     finally:
-        # Always save state on exit, even if an error occurred
-        logger.debug(f"Saving state to {state_path}")
-        app_state.save_to_file(path)
+        # Always save state on exit, even if an error occurred.
+        # Unchanged state is not rewritten, so read-only commands don't wake watchers.
+        if app_state.to_dict() != loaded:
+            logger.debug(f"Saving state to {state_path}")
+            app_state.save_to_file(path)
+
+
+ACTIVATION_STATS_PATH = Path("~/.local/state/keybindstate-activation.json").expanduser()
+
+
+class AdaptiveActivator:
+    """
+    Brings apps to the front using whichever activation strategy is fastest for each app.
+
+    Strategies are tried in ranked order until one succeeds. Per app and strategy the
+    latency is tracked as an exponential moving average and persisted, so the ranking
+    survives between invocations:
+    - strategies that last succeeded, fastest first
+    - strategies never tried, in declaration order
+    - strategies that last failed, fastest first
+    Every EXPLORE_EVERY activations of an app the runner-up goes first, so strategies that
+    failed once (e.g. the app was not running) or were never tried get re-measured.
+    """
+
+    ALPHA = 0.3
+    EXPLORE_EVERY = 20
+
+    def __init__(
+        self,
+        strategies: Dict[str, Callable[[str], bool]],
+        path: Optional[Path] = None,
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        self.strategies = strategies
+        self.path = path
+        self.clock = clock
+        self._stats: Optional[Dict[str, Any]] = None
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """Per-app stats, loaded from path on first use."""
+        if self._stats is None:
+            self._stats = {}
+            if self.path is not None and self.path.exists():
+                try:
+                    self._stats = json.loads(self.path.read_text())
+                except (json.JSONDecodeError, OSError) as e:
+                    logger.warning(f"Error loading activation stats from {self.path}: {e}")
+        return self._stats
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Replaced atomically, so concurrent invocations never leave a partial file behind
+        tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(self.stats, separators=(",", ":")))
+        os.replace(tmp_path, self.path)
+
+    def ranked(self, app: str) -> List[str]:
+        """Strategy names in the order they will be tried for app."""
+        app_stats = self.stats.get(app, {})
+        measured = app_stats.get("strategies", {})
+
+        def key(item):
+            position, name = item
+            entry = measured.get(name)
+            if entry is None:
+                return (1, position, position)
+            return (0 if entry["ok"] else 2, entry["ms"], position)
+
+        order = [name for _, name in sorted(enumerate(self.strategies), key=key)]
+        activations = app_stats.get("activations", 0)
+        if len(order) > 1 and activations and activations % self.EXPLORE_EVERY == 0:
+            order.insert(0, order.pop(1))
+        return order
+
+    def record(self, app: str, strategy: str, ok: bool, elapsed: float) -> None:
+        """Fold one measured attempt into the stats."""
+        measured = self.stats.setdefault(app, {"activations": 0, "strategies": {}})["strategies"]
+        ms = elapsed * 1000
+        entry = measured.get(strategy)
+        if entry is not None and entry["ok"] == ok:
+            ms = entry["ms"] + self.ALPHA * (ms - entry["ms"])
+        measured[strategy] = {
+            "ms": round(ms, 3),
+            "ok": ok,
+            "runs": (entry["runs"] if entry else 0) + 1,
+        }
+
+    def activate(self, app: str) -> Optional[str]:
+        """
+        Bring app to the front.
+
+        Returns:
+            Name of the strategy that succeeded, or None if they all failed.
+        """
+        used = None
+        for name in self.ranked(app):
+            start = self.clock()
+            try:
+                ok = bool(self.strategies[name](app))
+            except Exception:
+                logger.exception(f"Activation strategy '{name}' raised for '{app}'")
+                ok = False
+            self.record(app, name, ok, self.clock() - start)
+            if ok:
+                used = name
+                break
+            logger.debug(f"Activation strategy '{name}' failed for '{app}'")
+
+        self.stats[app]["activations"] += 1
+        self.save()
+        if used is None:
+            logger.error(f"Could not activate '{app}' with any strategy")
+        return used
+
+
+class SimulatedActivation:
+    """
+    Simulated activation backend for exercising AdaptiveActivator without a window server.
+
+    latencies[strategy][app] is the simulated latency in seconds, or None when the strategy
+    fails for that app. The "*" entry applies to apps without their own entry. Every
+    attempt advances the fake clock by its latency and is recorded in calls.
+    """
+
+    def __init__(self, latencies: Dict[str, Dict[str, Optional[float]]]):
+        self.latencies = latencies
+        self.now = 0.0
+        self.calls: List[tuple] = []
+
+    def clock(self) -> float:
+        return self.now
+
+    def strategies(self) -> Dict[str, Callable[[str], bool]]:
+        return {name: self._strategy(name) for name in self.latencies}
+
+    def _strategy(self, name: str) -> Callable[[str], bool]:
+        def run(app: str) -> bool:
+            self.calls.append((name, app))
+            table = self.latencies[name]
+            latency = table.get(app, table.get("*"))
+            self.now += 0.001 if latency is None else latency
+            return latency is not None
+
+        return run
+
+    def activator(self, path: Optional[Path] = None) -> AdaptiveActivator:
+        return AdaptiveActivator(self.strategies(), path=path, clock=self.clock)
+
+
+APP_CACHE_PATH = Path("~/.local/state/keybindstate-apps.json").expanduser()
+
+
+class AppResolver:
+    """
+    Persistent cache from app display names to canonical app identity.
+
+    Entries are keyed by lowercased name and hold the canonical "name", "bundle_id" and
+    "path" of the app. They are filled lazily through resolve on the first lookup of a
+    name, under both the requested and the canonical spelling. Names that could not be
+    resolved are remembered for MISS_TTL seconds, then resolved again. invalidate() drops
+    entries, e.g. after focusing through a cached identifier failed.
+    """
+
+    MISS_TTL = 24 * 3600
+
+    def __init__(
+        self,
+        resolve: Callable[[str], Optional[Dict[str, str]]],
+        path: Optional[Path] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.resolve = resolve
+        self.path = path
+        self.clock = clock
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+
+    @property
+    def entries(self) -> Dict[str, Dict[str, Any]]:
+        """Cached entries, loaded from path on first use."""
+        if self._entries is None:
+            self._entries = {}
+            if self.path is not None and self.path.exists():
+                try:
+                    self._entries = json.loads(self.path.read_text())
+                except (json.JSONDecodeError, OSError) as e:
+                    logger.warning(f"Error loading app cache from {self.path}: {e}")
+        return self._entries
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Replaced atomically, so concurrent invocations never leave a partial file behind
+        tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(self.entries, separators=(",", ":")))
+        os.replace(tmp_path, self.path)
+
+    def lookup(self, name: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the cached identity of an app, resolving it on a miss.
+
+        Returns:
+            Dict with "name", "bundle_id" and "path", or None if the app could not be resolved.
+        """
+        key = name.lower()
+        entry = self.entries.get(key)
+        if entry is not None and not entry.get("missing"):
+            return entry
+        if entry is not None and self.clock() - entry["resolved_at"] < self.MISS_TTL:
+            return None
+
+        logger.debug(f"Resolving app '{name}'")
+        resolved = self.resolve(name)
+        if resolved is None:
+            self.entries[key] = {"missing": True, "resolved_at": self.clock()}
+            self.save()
+            return None
+
+        entry = {**resolved, "resolved_at": self.clock()}
+        self.entries[key] = entry
+        self.entries[entry["name"].lower()] = entry
+        self.save()
+        return entry
+
+    def canonical(self, name: str) -> str:
+        """Get the canonical spelling of an app name, or name itself if it can't be resolved."""
+        entry = self.lookup(name)
+        return entry["name"] if entry is not None else name
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """Forget an app (under every spelling), or every app if name is None."""
+        if name is None:
+            self.entries.clear()
+        else:
+            entry = self.entries.pop(name.lower(), None)
+            if entry is not None and not entry.get("missing"):
+                for key in [k for k, v in self.entries.items() if v.get("bundle_id") == entry["bundle_id"]]:
+                    del self.entries[key]
+        self.save()
 
 
 class Platform:
+    resolver: Optional[AppResolver] = None
+
     @abstractmethod
     def current_app_name(self) -> str: ...
 
     @abstractmethod
     def focus_app(self, app: str) -> None: ...
 
+    def canonical_name(self, app: str) -> str:
+        """Get the canonical spelling of an app name, so stack entries match platform names exactly."""
+        if self.resolver is None:
+            return app
+        return self.resolver.canonical(app)
+
 
 class MacOS(Platform):
     # Helper/system processes that should be ignored
@@ -379,6 +802,17 @@ class MacOS(Platform):
         "NotificationCenter",
     }
 
+    def __init__(
+        self,
+        activator: Optional[AdaptiveActivator] = None,
+        resolver: Optional[AppResolver] = None,
+    ):
+        self.activator = activator or AdaptiveActivator(
+            {"activate": self._activate_running, "open": self._open},
+            path=ACTIVATION_STATS_PATH,
+        )
+        self.resolver = resolver or AppResolver(self._resolve, path=APP_CACHE_PATH)
+
     def current_app_name(self) -> str:
         # Method 1: Simple direct query first (most reliable)
         cmd_simple = "osascript -e 'tell application \"System Events\" to get name of first application process whose frontmost is true'"
@@ -429,17 +863,396 @@ class MacOS(Platform):
         if result in self.HELPER_PROCESSES or "app_mode_loader" in result.lower():
             logger.warning(f"Got helper process '{result}' instead of real app. You may need to manually add apps.")
         
+        result = self.canonical_name(result)
         logger.debug(f"Final app name: '{result}'")
         return result
 
+    @staticmethod
+    def _quote(value: str) -> str:
+        return value.replace("\\", "\\\\").replace('"', '\\"')
+
+    def _resolve(self, app: str) -> Optional[Dict[str, str]]:
+        """Ask LaunchServices for the canonical name, bundle identifier and path of an app."""
+        import subprocess
+
+        name = self._quote(app)
+        script = (
+            f'set appPath to POSIX path of (path to application "{name}")\n'
+            f'return (name of application "{name}") & linefeed & (id of application "{name}") & linefeed & appPath'
+        )
+        try:
+            result = subprocess.run(["osascript", "-e", script], capture_output=True, text=True)
+        except OSError as e:
+            logger.debug(f"Could not resolve app '{app}': {e}")
+            return None
+        lines = result.stdout.strip().splitlines()
+        if result.returncode != 0 or len(lines) != 3:
+            logger.debug(f"Could not resolve app '{app}': {result.stderr.strip()}")
+            return None
+        return {"name": lines[0], "bundle_id": lines[1], "path": lines[2]}
+
+    def _activate_running(self, app: str) -> bool:
+        """
+        Bring an already running app to the front, without LaunchServices name resolution.
+        Fails for apps without windows: raising them sends no reopen event, so they would only
+        show their menu bar, while `open` makes them show a window.
+        """
+        import subprocess
+
+        entry = self.resolver.lookup(app)
+        if entry is not None:
+            process = f'first application process whose bundle identifier is "{self._quote(entry["bundle_id"])}"'
+        else:
+            process = f'first application process whose name is "{self._quote(app)}"'
+        script = (
+            'tell application "System Events"\n'
+            f"set proc to {process}\n"
+            'if (count of windows of proc) is 0 then error "no windows"\n'
+            "set frontmost of proc to true\n"
+            "end tell"
+        )
+        return subprocess.run(["osascript", "-e", script], capture_output=True).returncode == 0
+
+    def _open(self, app: str) -> bool:
+        """Launch or activate app through LaunchServices, by bundle identifier when it is known."""
+        import subprocess
+
+        entry = self.resolver.lookup(app)
+        argv = ["open", "-b", entry["bundle_id"]] if entry is not None else ["open", "-a", app]
+        return subprocess.run(argv, capture_output=True).returncode == 0
+
     def focus_app(self, app: str) -> None:
         logger.debug(f"Focusing app: {app}")
-        os.system(f'open -a "{app}"')
+        strategy = self.activator.activate(app)
+        if strategy is None and self.resolver.lookup(app) is not None:
+            # The cached identity may be stale (app moved, renamed or reinstalled)
+            logger.debug(f"Refreshing cached identity of '{app}'")
+            self.resolver.invalidate(app)
+            strategy = self.activator.activate(app)
+        logger.debug(f"Focused app '{app}' using strategy: {strategy}")
+
+
+class TracingPlatform(Platform):
+    """Wraps another platform and remembers every app name it reports."""
+
+    def __init__(self, inner: Platform):
+        self.inner = inner
+        self.seen: List[str] = []
+        self.canonical: Dict[str, str] = {}
+
+    def current_app_name(self) -> str:
+        name = self.inner.current_app_name()
+        self.seen.append(name)
+        return name
+
+    def focus_app(self, app: str) -> None:
+        self.inner.focus_app(app)
+
+    def canonical_name(self, app: str) -> str:
+        name = self.inner.canonical_name(app)
+        if name != app:
+            self.canonical[app] = name
+        return name
+
+
+class FakePlatform(Platform):
+    """
+    In-memory platform used for replays.
+    Reports queued front app names and records focus requests instead of acting on them.
+    Apps in installed (canonical name -> {"bundle_id", "path"}) resolve through an
+    AppResolver like on a real platform; aliases are fixed canonical names, e.g. from a trace.
+    """
+
+    def __init__(
+        self,
+        front_apps: Sequence[str] = (),
+        activator: Optional[AdaptiveActivator] = None,
+        installed: Optional[Dict[str, Dict[str, str]]] = None,
+        cache_path: Optional[Path] = None,
+    ):
+        self.front_apps = deque(front_apps)
+        self.focused: List[str] = []
+        self.activator = activator
+        self.aliases: Dict[str, str] = {}
+        self.installed = installed
+        self.resolved: List[str] = []
+        if installed is not None:
+            self.resolver = AppResolver(self._resolve, path=cache_path)
+
+    def _resolve(self, app: str) -> Optional[Dict[str, str]]:
+        self.resolved.append(app)
+        for name, info in self.installed.items():
+            if name.lower() == app.lower():
+                return {"name": name, **info}
+        return None
+
+    def canonical_name(self, app: str) -> str:
+        if app in self.aliases:
+            return self.aliases[app]
+        return super().canonical_name(app)
+
+    def current_app_name(self) -> str:
+        if not self.front_apps:
+            raise RuntimeError("Could not determine current application name - no front app queued")
+        return self.front_apps.popleft()
+
+    def focus_app(self, app: str) -> None:
+        self.focused.append(app)
+        if self.activator is not None:
+            self.activator.activate(app)
 
 
 # hard coded for now
 PLATFORM = MacOS()
 
+
+class HookPipeline:
+    """
+    Runs subscribers when the current app changes.
+
+    Fast hooks run inline, in registration order. Every other hook runs concurrently on a
+    bounded pool of daemon worker threads, so a slow or failing hook never delays the
+    command. Call drain() once the command is done to wait for background hooks, each up
+    to its timeout counted from when a worker starts it; hooks that fail, run past their
+    timeout or never got a worker are logged and reported.
+    """
+
+    def __init__(self, max_workers: int = 4, default_timeout: float = 1.0):
+        self.max_workers = max_workers
+        self.default_timeout = default_timeout
+        self._hooks: Dict[str, Dict[str, Any]] = {}
+        self._cond = threading.Condition()
+        self._queued: deque = deque()
+        self._workers: List[threading.Thread] = []
+        self._pending: List[Dict[str, Any]] = []
+        # Child processes of running shell hooks, killed by drain() if still running
+        self.processes: set = set()
+
+    def register(
+        self,
+        name: str,
+        func: Callable[[str], None],
+        timeout: Optional[float] = None,
+        fast: bool = False,
+    ) -> None:
+        """
+        Register a hook, replacing any hook with the same name.
+
+        Args:
+            name: Name used in logs and reports.
+            func: Called with the new current app.
+            timeout: Seconds to wait for a background hook. If None, uses default_timeout.
+            fast: Run inline on the command's path instead of in the worker pool.
+        """
+        self._hooks[name] = {
+            "func": func,
+            "timeout": self.default_timeout if timeout is None else timeout,
+            "fast": fast,
+        }
+
+    def unregister(self, name: str) -> None:
+        self._hooks.pop(name, None)
+
+    def __call__(self, app: str) -> None:
+        for name, hook in self._hooks.items():
+            if not hook["fast"]:
+                self._submit(name, hook, app)
+        for name, hook in self._hooks.items():
+            if hook["fast"]:
+                try:
+                    hook["func"](app)
+                except Exception:
+                    logger.exception(f"Hook '{name}' failed for '{app}'")
+
+    def _submit(self, name: str, hook: Dict[str, Any], app: str) -> None:
+        job = {
+            "name": name,
+            "func": hook["func"],
+            "app": app,
+            "timeout": hook["timeout"],
+            "deadline": None,
+            "done": False,
+            "error": None,
+        }
+        with self._cond:
+            self._pending.append(job)
+            self._queued.append(job)
+            self._cond.notify()
+        if len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._work, daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queued:
+                    self._cond.wait()
+                job = self._queued.popleft()
+                job["deadline"] = time.monotonic() + job["timeout"]
+                self._cond.notify_all()
+            try:
+                job["func"](job["app"])
+            except Exception as e:
+                job["error"] = e
+                logger.exception(f"Hook '{job['name']}' failed for '{job['app']}'")
+            finally:
+                with self._cond:
+                    job["done"] = True
+                    self._cond.notify_all()
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """
+        Wait for background hooks, each until its own deadline.
+
+        Hooks still queued once every worker is stuck in a hook past its deadline are
+        skipped, and child processes of shell hooks still running are killed.
+
+        Returns:
+            One report per hook that failed, timed out or was skipped.
+        """
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                running = [job for job in self._pending if job["deadline"] is not None and not job["done"]]
+                live = [job for job in running if job["deadline"] > now]
+                stuck = len(running) - len(live)
+                if not live and (not self._queued or stuck >= len(self._workers)):
+                    break
+                # Woken when a hook starts or finishes; queued hooks start as soon as a worker is free
+                self._cond.wait(min((job["deadline"] for job in live), default=now + 0.1) - now)
+            # Workers that free up later must not start hooks of a finished command
+            self._queued.clear()
+            pending, self._pending = self._pending, []
+
+        problems = []
+        for job in pending:
+            report = {"hook": job["name"], "app": job["app"]}
+            if job["deadline"] is None:
+                logger.warning(f"Hook '{job['name']}' skipped for '{job['app']}': no free worker")
+                problems.append({**report, "status": "skipped"})
+            elif not job["done"]:
+                logger.warning(f"Hook '{job['name']}' timed out after {job['timeout']}s for '{job['app']}'")
+                problems.append({**report, "status": "timeout"})
+            elif job["error"] is not None:
+                problems.append({**report, "status": "error", "error": str(job["error"])})
+
+        for process in self.processes.copy():
+            logger.warning(f"Killing hook process {process.pid} ({process.args!r}), still running after drain")
+            with suppress(OSError):
+                process.kill()
+        return problems
+
+    def load_config(self, path: Optional[Path] = None) -> None:
+        """
+        Register shell command hooks from a JSON config file.
+
+        Example:
+            {"hooks": [{"name": "statusbar", "command": ["sketchybar", "--trigger", "app_switch"], "timeout": 0.5}]}
+
+        "{app}" in a list command is replaced by the app name. String commands run through
+        the shell. The app name is always available as $KEYBINDSTATE_APP.
+
+        Args:
+            path: Path to config file. If None, uses HOOKS_CONFIG_PATH.
+        """
+        if path is None:
+            path = HOOKS_CONFIG_PATH
+
+        if not path.exists():
+            return
+
+        try:
+            config = json.loads(path.read_text())
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"Error loading hooks from {path}: {e}")
+            return
+
+        hooks = config.get("hooks", []) if isinstance(config, dict) else None
+        if not isinstance(hooks, list):
+            logger.warning(f"Ignoring hooks in {path}: expected an object with a \"hooks\" list")
+            return
+
+        for entry in hooks:
+            if not isinstance(entry, dict) or not isinstance(entry.get("name"), str):
+                logger.warning(f"Ignoring hook without a name in {path}: {entry!r}")
+                continue
+            command = entry.get("command")
+            is_argv = isinstance(command, list) and all(isinstance(part, str) for part in command)
+            if not (isinstance(command, str) or is_argv):
+                logger.warning(f"Ignoring hook '{entry['name']}' in {path}: command must be a string or a list of strings")
+                continue
+            timeout = entry.get("timeout", self.default_timeout)
+            if not isinstance(timeout, (int, float)) or timeout <= 0:
+                logger.warning(f"Ignoring hook '{entry['name']}' in {path}: timeout must be a positive number")
+                continue
+            self.register(
+                entry["name"],
+                shell_hook(command, timeout, self.processes),
+                timeout=timeout,
+                fast=entry.get("fast", False),
+            )
+
+
+def shell_hook(
+    command: Union[str, List[str]],
+    timeout: float,
+    processes: Optional[set] = None,
+) -> Callable[[str], None]:
+    """
+    Build a hook that runs a command, killing it after timeout seconds.
+
+    The running process is kept in processes, if given, so it can be killed should the
+    hook be abandoned before its timeout (e.g. HookPipeline.drain at exit).
+    """
+
+    def run(app: str) -> None:
+        import subprocess
+
+        argv = command if isinstance(command, str) else [part.replace("{app}", app) for part in command]
+        with subprocess.Popen(
+            argv,
+            shell=isinstance(command, str),
+            env={**os.environ, "KEYBINDSTATE_APP": app},
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        ) as process:
+            if processes is not None:
+                processes.add(process)
+            try:
+                stdout, stderr = process.communicate(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+                raise
+            finally:
+                if processes is not None:
+                    processes.discard(process)
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, argv, stdout, stderr)
+
+    return run
+
+
+HOOKS_CONFIG_PATH = Path("~/.config/keybindstate/hooks.json").expanduser()
+HOOKS = HookPipeline()
+
+
+def register_hook(name: str, timeout: Optional[float] = None, fast: bool = False):
+    """Decorator to register a current-app-changed hook."""
+
+    def decorator(func):
+        HOOKS.register(name, func, timeout=timeout, fast=fast)
+        return func
+
+    return decorator
+
+
+@register_hook("focus", fast=True)
+def hook_focus(app: str) -> None:
+    """Bring the new current app to the front."""
+    PLATFORM.focus_app(app)
+
 # Command registry for CLI
 COMMANDS = {}
 
@@ -459,6 +1272,11 @@ def register_command(name: str, description: Optional[str] = None):
 
 def setup_parser(parser: ArgumentParser):
     """Set up all command parsers."""
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=f"Profile this invocation into {PROFILE_DIR} (also enabled by {PROFILE_ENV}=1)",
+    )
     subparsers = parser.add_subparsers(dest="cmd", help="Command to execute")
 
     # Stack navigation commands
@@ -543,6 +1361,78 @@ def setup_parser(parser: ArgumentParser):
         "--count", "-c", type=int, default=1, help="Number of positions to move down (default: 1)"
     )
 
+    switch_match_parser = subparsers.add_parser(
+        "switch-match", help="Switch to the best matching known app"
+    )
+    switch_match_parser.add_argument("query", help="Prefix or fuzzy query")
+
+    match_parser = subparsers.add_parser(
+        "match", help="List known apps matching a query, best first"
+    )
+    match_parser.add_argument("query", help="Prefix or fuzzy query")
+    match_parser.add_argument(
+        "--limit", "-n", type=int, default=10, help="Maximum number of matches (default: 10)"
+    )
+
+    replay_parser = subparsers.add_parser(
+        "replay", help="Replay a recorded trace against a fake platform"
+    )
+    replay_parser.add_argument("trace", help="Path to trace file")
+    replay_parser.add_argument(
+        "--speed",
+        type=float,
+        default=0.0,
+        help="Replay speed relative to recording (default: 0, as fast as possible)",
+    )
+    replay_parser.add_argument(
+        "--persist",
+        action="store_true",
+        help="Load and save state from a scratch file around every command",
+    )
+
+    app_cache_parser = subparsers.add_parser(
+        "app-cache", help="Show or invalidate the app name resolution cache"
+    )
+    app_cache_parser.add_argument(
+        "--forget", metavar="APP", help="Forget one app, it is resolved again on next use"
+    )
+    app_cache_parser.add_argument(
+        "--clear", action="store_true", help="Forget every app"
+    )
+
+    watch_parser = subparsers.add_parser(
+        "watch", help="Stream state changes as JSON lines"
+    )
+    watch_parser.add_argument(
+        "--no-snapshot",
+        dest="snapshot",
+        action="store_false",
+        help="Don't start with a snapshot of the current state",
+    )
+
+    profile_report_parser = subparsers.add_parser(
+        "profile-report", help="Merge captured profiles into one hotspot report"
+    )
+    profile_report_parser.add_argument(
+        "--script",
+        default="keybindstate",
+        help="Script whose profiles to merge, e.g. itermctl (default: keybindstate)",
+    )
+    profile_report_parser.add_argument(
+        "--sort",
+        default="cumulative",
+        help="pstats sort key, e.g. cumulative, tottime, ncalls (default: cumulative)",
+    )
+    profile_report_parser.add_argument(
+        "--limit", "-n", type=int, default=30, help="Number of functions to show (default: 30)"
+    )
+    profile_report_parser.add_argument(
+        "--last", type=int, help="Only merge the newest N profiles (default: all)"
+    )
+    profile_report_parser.add_argument(
+        "--cmd", dest="profiled_cmd", help="Only merge profiles of this command"
+    )
+
     return parser
 
 
@@ -551,7 +1441,24 @@ def setup_parser(parser: ArgumentParser):
 def cmd_switch(args, app_state: AppState):
     """Switch to an app and add to stack."""
     assert isinstance(args.app, str)
-    app_state.current_app = args.app
+    app_state.current_app = PLATFORM.canonical_name(args.app)
+
+
+@register_command("switch-match", "Switch to the best matching known app")
+def cmd_switch_match(args, app_state: AppState):
+    """Switch to the known app that best matches a prefix or fuzzy query."""
+    app = app_state.app_index.best(args.query)
+    if app is None:
+        print(f"Error: No known app matches '{args.query}'", file=sys.stderr)
+        exit(1)
+    app_state.current_app = PLATFORM.canonical_name(app)
+
+
+@register_command("match", "List known apps matching a query")
+def cmd_match(args, app_state: AppState):
+    """List known apps matching a query, best first, without switching."""
+    for app in app_state.app_index.search(args.query, limit=args.limit):
+        print(app)
 
 
 @register_command("state", "Show current state")
@@ -583,6 +1490,7 @@ def cmd_index(args, app_state: AppState):
     """Go to app at index."""
     if 1 <= args.n <= len(app_state):
         app_state.current_index = args.n - 1
+        app_state.record_use()
 
 
 @register_command("remove", "Remove an app from stack")
@@ -618,13 +1526,14 @@ def cmd_add_current(args, app_state: AppState):
 def cmd_remove_current(args, app_state: AppState):
     """Remove current app from stack."""
     current_app = PLATFORM.current_app_name()
+    app_state.app_index.add(current_app)
     app_state.remove_from_stack(current_app)
 
 
 @register_command("set-mapping", "Set a key-to-app mapping")
 def cmd_set_mapping(args, app_state: AppState):
     """Set a mapping from key to app."""
-    app = args.app if args.app is not None else PLATFORM.current_app_name()
+    app = PLATFORM.canonical_name(args.app) if args.app is not None else PLATFORM.current_app_name()
     app_state[args.key] = app
 
 
@@ -634,7 +1543,7 @@ def cmd_open_mapping(args, app_state: AppState):
     try:
         app = app_state[args.key]
         assert app is not None
-        app_state.current_app = app
+        app_state.current_app = PLATFORM.canonical_name(app)
     except KeyError as e:
         print(str(e), file=sys.stderr)
         exit(1)
@@ -730,6 +1639,430 @@ def cmd_move_down(args, app_state: AppState):
     app_state.move_app_down(app_to_move, args.count)
 
 
+# Tracing
+TRACE_ENV = "KEYBINDSTATE_TRACE"
+DEFAULT_TRACE_PATH = Path("~/.local/state/keybindstate.trace.jsonl").expanduser()
+
+
+def trace_path() -> Optional[Path]:
+    """
+    Get the trace file from the environment.
+    KEYBINDSTATE_TRACE=1 uses DEFAULT_TRACE_PATH, any other value is used as a path.
+    """
+    value = os.environ.get(TRACE_ENV)
+    if not value:
+        return None
+    if value == "1":
+        return DEFAULT_TRACE_PATH
+    return Path(value).expanduser()
+
+
+def state_hash(state_dict: Dict[str, Any]) -> str:
+    """
+    Short, stable hash of a serialized state.
+    Frecency scores depend on the wall clock, so they are left out.
+    """
+    import hashlib
+
+    state_dict = {k: v for k, v in state_dict.items() if k != "appfrecency"}
+    encoded = json.dumps(state_dict, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(encoded.encode()).hexdigest()[:12]
+
+
+def _last_trace_hash(path: Path) -> Optional[str]:
+    """Read the resulting state hash of the last record, without reading the whole trace."""
+    try:
+        with path.open("rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            block = 4096
+            while True:
+                start = max(0, size - block)
+                f.seek(start)
+                lines = f.read().rstrip(b"\n").split(b"\n")
+                if len(lines) > 1 or start == 0:
+                    return json.loads(lines[-1]).get("hash")
+                block *= 2
+    except (OSError, ValueError):
+        return None
+
+
+@contextmanager
+def trace(args: Namespace, app_state: AppState, path: Optional[Path] = None):
+    """
+    Context manager that records one invocation to the trace file.
+
+    Each record is a single JSON line with the command, its arguments, the time it was
+    received, the app names reported by the platform and the hash of the resulting state.
+    When the state on entry does not match the hash of the previous record (first record,
+    or the state was changed while tracing was off) the full state is stored under "sync"
+    so replays can resynchronise. Frecency is scored at the recorded time for the whole
+    invocation, so replays feeding that time back in rank apps the same way.
+
+    Args:
+        args: Parsed command line arguments.
+        app_state: State the command runs against.
+        path: Path to trace file. If None, uses trace_path().
+    """
+    global PLATFORM
+    path = path or trace_path()
+    if path is None:
+        yield
+        return
+
+    before = app_state.to_dict()
+    platform = PLATFORM
+    tracer = PLATFORM = TracingPlatform(platform)
+    record: Dict[str, Any] = {
+        "t": round(time.time(), 6),
+        "cmd": args.cmd,
+        "args": {k: v for k, v in vars(args).items() if k != "cmd"},
+    }
+    app_state.app_index.clock = lambda: record["t"]
+    try:
+        yield
+    except SystemExit as e:
+        record["exit"] = e.code
+        raise
+    finally:
+        PLATFORM = platform
+        if tracer.seen:
+            record["front"] = tracer.seen
+        if tracer.canonical:
+            record["canonical"] = tracer.canonical
+        record["hash"] = state_hash(app_state.to_dict())
+        if _last_trace_hash(path) != state_hash(before):
+            record["sync"] = before
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("a") as f:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+
+def _percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, round(q * (len(values) - 1)))]
+
+
+def replay(path: Path, speed: float = 0.0, persist: bool = False) -> Dict[str, Any]:
+    """
+    Feed a recorded trace through the COMMANDS handlers against a FakePlatform.
+
+    Args:
+        path: Path to trace file.
+        speed: Replay speed relative to the recording. 0 replays as fast as possible.
+        persist: Load and save state from a scratch file around every command,
+            like a real invocation does.
+
+    Returns:
+        Report with throughput, latency percentiles and state divergences.
+    """
+    import io
+    import tempfile
+    from contextlib import redirect_stderr, redirect_stdout
+
+    global PLATFORM
+    records = [json.loads(line) for line in path.read_text().splitlines() if line.strip()]
+
+    platform = PLATFORM
+    fake = PLATFORM = FakePlatform()
+    # Frecency is scored at each record's time, as it was when recorded
+    now = 0.0
+    clock = lambda: now
+    app_state = AppState(on_current_changed=fake.focus_app, clock=clock)
+    latencies: List[float] = []
+    divergences: List[Dict[str, Any]] = []
+    skipped = 0
+    try:
+        with tempfile.TemporaryDirectory() as tmp, redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            state_path = Path(tmp) / "state.json"
+            app_state.save_to_file(state_path)
+            start = time.perf_counter()
+            for i, record in enumerate(records):
+                if record["cmd"] not in COMMANDS:
+                    skipped += 1
+                    continue
+
+                if speed > 0:
+                    delay = (record["t"] - records[0]["t"]) / speed - (time.perf_counter() - start)
+                    if delay > 0:
+                        time.sleep(delay)
+
+                now = record["t"]
+                if "sync" in record:
+                    app_state = AppState.from_dict(record["sync"], clock=clock)
+                    app_state.save_to_file(state_path)
+
+                fake.front_apps = deque(record.get("front", []))
+                fake.aliases.update(record.get("canonical", {}))
+                args = Namespace(cmd=record["cmd"], **record["args"])
+                handler = COMMANDS[record["cmd"]]["handler"]
+
+                t0 = time.perf_counter()
+                if persist:
+                    app_state = AppState.load_from_file(state_path, clock=clock)
+                with suppress(SystemExit):
+                    handler(args, app_state)
+                if persist:
+                    app_state.save_to_file(state_path)
+                latencies.append(time.perf_counter() - t0)
+
+                actual = state_hash(app_state.to_dict())
+                if actual != record["hash"]:
+                    divergences.append(
+                        {"index": i, "cmd": record["cmd"], "expected": record["hash"], "actual": actual}
+                    )
+            elapsed = time.perf_counter() - start
+    finally:
+        PLATFORM = platform
+
+    latencies.sort()
+    return {
+        "commands": len(latencies),
+        "skipped": skipped,
+        "elapsed_s": round(elapsed, 6),
+        "throughput_per_s": round(len(latencies) / elapsed, 1) if elapsed > 0 else None,
+        "latency_us": {
+            name: round(_percentile(latencies, q) * 1e6, 1)
+            for name, q in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0))
+        },
+        "focused": len(fake.focused),
+        "divergences": len(divergences),
+        "first_divergences": divergences[:10],
+    }
+
+
+# Watching
+def _current(state_dict: Dict[str, Any]) -> Optional[str]:
+    stack = state_dict.get("appstack", [])
+    index = state_dict.get("appindex", 0)
+    return stack[index] if 0 <= index < len(stack) else None
+
+
+def state_event(old: Optional[Dict[str, Any]], new: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Describe the difference between two serialized states as a compact event.
+
+    With no old state the event is a full snapshot. Otherwise only what changed is included:
+    "current", "stack" (new order) with "added"/"removed", and "mapping" (changed keys)
+    with "unmapped". Frecency changes alone produce no event.
+
+    Returns:
+        The event, or None if nothing relevant changed.
+    """
+    new_stack, new_mapping = new.get("appstack", []), new.get("appmapping", {})
+    if old is None:
+        return {"event": "snapshot", "current": _current(new), "stack": new_stack, "mapping": new_mapping}
+
+    event: Dict[str, Any] = {}
+    if _current(old) != _current(new):
+        event["current"] = _current(new)
+
+    old_stack = old.get("appstack", [])
+    if old_stack != new_stack:
+        event["stack"] = new_stack
+        added = [app for app in new_stack if app not in old_stack]
+        removed = [app for app in old_stack if app not in new_stack]
+        if added:
+            event["added"] = added
+        if removed:
+            event["removed"] = removed
+
+    old_mapping = old.get("appmapping", {})
+    changed = {k: v for k, v in new_mapping.items() if old_mapping.get(k) != v}
+    unmapped = [k for k in old_mapping if k not in new_mapping]
+    if changed:
+        event["mapping"] = changed
+    if unmapped:
+        event["unmapped"] = unmapped
+
+    if not event:
+        return None
+    return {"event": "change", **event}
+
+
+def _inotify_waiter(directory: Path, name: str) -> Callable[[], None]:
+    """Block until name is written or moved into directory, using Linux inotify."""
+    import ctypes
+    import ctypes.util
+    import struct
+
+    IN_CLOSE_WRITE, IN_MOVED_TO = 0x8, 0x80
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    fd = libc.inotify_init1(os.O_CLOEXEC)
+    if fd < 0 or libc.inotify_add_watch(fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        raise OSError(ctypes.get_errno(), "Could not set up inotify watch")
+    target = os.fsencode(name)
+
+    def wait() -> None:
+        while True:
+            data = os.read(fd, 65536)
+            offset, hit = 0, False
+            while offset < len(data):
+                _, _, _, length = struct.unpack_from("iIII", data, offset)
+                hit = hit or data[offset + 16 : offset + 16 + length].rstrip(b"\0") == target
+                offset += 16 + length
+            if hit:
+                return
+
+    return wait
+
+
+def _kqueue_waiter(directory: Path) -> Callable[[], None]:
+    """Block until an entry of directory changes (e.g. a file is replaced), using kqueue."""
+    import select
+
+    fd = os.open(directory, os.O_RDONLY)
+    kq = select.kqueue()
+    kq.control(
+        [
+            select.kevent(
+                fd,
+                filter=select.KQ_FILTER_VNODE,
+                flags=select.KQ_EV_ADD | select.KQ_EV_CLEAR,
+                fflags=select.KQ_NOTE_WRITE,
+            )
+        ],
+        0,
+    )
+
+    def wait() -> None:
+        kq.control(None, 1, None)
+
+    return wait
+
+
+def change_waiter(path: Path) -> Callable[[], None]:
+    """
+    Set up change notification for a file that is replaced atomically on save.
+    Returns a function that blocks until the file may have changed.
+    """
+    import select
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        if hasattr(select, "kqueue"):
+            return _kqueue_waiter(path.parent)
+        return _inotify_waiter(path.parent, path.name)
+    except (OSError, AttributeError) as e:
+        logger.warning(f"No file change notification for {path} ({e}), polling instead")
+        return lambda: time.sleep(0.5)
+
+
+def watch(path: Optional[Path] = None, snapshot: bool = True) -> None:
+    """
+    Print an event for every change to the state file, one JSON line each, forever.
+
+    Waits on file change notifications instead of polling and only reads the state,
+    so subscribers add no load while nothing changes and never rewrite the file.
+
+    Args:
+        path: Path to state file. If None, uses DEFAULT_STATE_PATH.
+        snapshot: Start with a snapshot of the current state.
+    """
+    if path is None:
+        path = AppState.DEFAULT_STATE_PATH
+
+    # Set up notification before the first read, so no change is missed in between
+    wait = change_waiter(path)
+    last: Optional[Dict[str, Any]] = None
+    last_stat = None
+    first = True
+    try:
+        while True:
+            if not first:
+                wait()
+            first = False
+            try:
+                stat = path.stat()
+                stat_key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                if stat_key == last_stat:
+                    continue
+                current = json.loads(path.read_text())
+            except (OSError, ValueError):
+                # Missing or being written by something else, wait for the next change
+                continue
+            last_stat = stat_key
+
+            event = state_event(last, current) if (last is not None or snapshot) else None
+            if event is not None:
+                print(json.dumps({"t": round(time.time(), 3), **event}, separators=(",", ":")), flush=True)
+            last = current
+    except (KeyboardInterrupt, BrokenPipeError):
+        # Subscriber went away
+        with suppress(OSError):
+            sys.stdout.close()
+
+
+# Profiling
+PROFILE_ENV = "KEYBINDSTATE_PROFILE"
+PROFILE_DIR = Path("~/.local/state/profiles").expanduser()
+PROFILE_KEEP = 500
+
+
+# profiling_enabled and profile are copied verbatim into iterm/itermctl.py, which is standalone;
+# keep the copies identical, profile-report depends on the file naming and rotation
+def profiling_enabled() -> bool:
+    # checked before argument parsing, so argparse construction shows up in the profile
+    return os.environ.get(PROFILE_ENV, "") not in ("", "0") or "--profile" in sys.argv[1:2]
+
+
+@contextmanager
+def profile(directory: str, keep: int = PROFILE_KEEP):
+    """Profile the body into directory as <time_ns>-<pid>-<label>.prof, keeping the newest keep."""
+    import cProfile
+    from pathlib import Path
+
+    info = {"label": "run"}
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield info
+    finally:
+        profiler.disable()
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(path / f"{time.time_ns()}-{os.getpid()}-{info['label']}.prof")
+        for old in sorted(path.glob("*.prof"))[:-keep]:
+            old.unlink(missing_ok=True)
+
+
+def profile_report(
+    directory: Path,
+    sort: str = "cumulative",
+    limit: int = 30,
+    last: Optional[int] = None,
+    cmd: Optional[str] = None,
+) -> None:
+    """
+    Merge captured profiles into one report and print it.
+
+    Args:
+        directory: Directory the profiles were written to.
+        sort: pstats sort key.
+        limit: Number of functions to show.
+        last: Only merge the newest N profiles. If None, merges all of them.
+        cmd: Only merge profiles labelled with this command.
+    """
+    import pstats
+
+    files = sorted(directory.glob("*.prof"))
+    if cmd is not None:
+        files = [f for f in files if f.stem.split("-", 2)[-1] == cmd]
+    if last is not None:
+        files = files[-last:]
+    if not files:
+        print(f"Error: No profiles found in {directory}", file=sys.stderr)
+        exit(1)
+
+    stats = pstats.Stats(*map(str, files), stream=sys.stdout)
+    # pstats lists every merged file; the summary line below replaces that
+    stats.files = []
+    print(f"Merged {len(files)} profiles from {directory}")
+    stats.sort_stats(sort).print_stats(limit)
+
+
 def parse_args() -> Namespace:
     """Parse command line arguments."""
     parser = ArgumentParser(description="Manage app state and key mappings")
@@ -741,24 +2074,70 @@ def parse_args() -> Namespace:
     return args
 
 
-if __name__ == "__main__":
+def main(session: Dict[str, Any]) -> None:
     args = parse_args()
+    session["label"] = args.cmd
 
-    with state() as app_state:
-        # Get command handler from registry
-        if args.cmd not in COMMANDS:
-            logger.error(f"Unknown command '{args.cmd}'")
-            print(f"Error: Unknown command '{args.cmd}'", file=sys.stderr)
+    if args.cmd == "replay":
+        report = replay(Path(args.trace).expanduser(), speed=args.speed, persist=args.persist)
+        print(json.dumps(report, indent=2))
+        exit(1 if report["divergences"] else 0)
+
+    if args.cmd == "app-cache":
+        resolver = PLATFORM.resolver
+        if resolver is None:
+            print("Error: Platform has no app cache", file=sys.stderr)
             exit(1)
+        if args.clear:
+            resolver.invalidate()
+        elif args.forget is not None:
+            resolver.invalidate(args.forget)
+        print(json.dumps(resolver.entries, indent=2))
+        return
+
+    if args.cmd == "watch":
+        watch(snapshot=args.snapshot)
+        return
+
+    if args.cmd == "profile-report":
+        profile_report(
+            PROFILE_DIR / args.script,
+            sort=args.sort,
+            limit=args.limit,
+            last=args.last,
+            cmd=args.profiled_cmd,
+        )
+        return
 
-        # Log command execution
-        cmd_args = {k: v for k, v in vars(args).items() if k != "cmd" and v is not None}
-        logger.info(f"Executing command: {args.cmd} with args: {cmd_args}")
+    HOOKS.load_config()
+    try:
+        with state() as app_state, trace(args, app_state):
+            # Get command handler from registry
+            if args.cmd not in COMMANDS:
+                logger.error(f"Unknown command '{args.cmd}'")
+                print(f"Error: Unknown command '{args.cmd}'", file=sys.stderr)
+                exit(1)
 
-        handler = COMMANDS[args.cmd]["handler"]
-        handler(args, app_state)
+            # Log command execution
+            cmd_args = {k: v for k, v in vars(args).items() if k != "cmd" and v is not None}
+            logger.info(f"Executing command: {args.cmd} with args: {cmd_args}")
 
-        logger.debug(f"State after command: {app_state.to_dict()}")
+            handler = COMMANDS[args.cmd]["handler"]
+            handler(args, app_state)
 
-        # Print state after command execution
-        print(json.dumps(app_state.to_dict(), indent=2))
+            logger.debug(f"State after command: {app_state.to_dict()}")
+
+            # Print state after command execution
+            print(json.dumps(app_state.to_dict(), indent=2))
+    finally:
+        for problem in HOOKS.drain():
+            detail = f": {problem['error']}" if "error" in problem else ""
+            print(
+                f"Warning: hook '{problem['hook']}' {problem['status']} for '{problem['app']}'{detail}",
+                file=sys.stderr,
+            )
+
+
+if __name__ == "__main__":
+    with profile(str(PROFILE_DIR / "keybindstate")) if profiling_enabled() else nullcontext({}) as session:
+        main(session)
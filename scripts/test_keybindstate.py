@@ -0,0 +1,145 @@
+# Tests for keybindstate's activation strategy selection and app name cache, run anywhere
+# :: uses SimulatedActivation and FakePlatform(installed=...) instead of a window server / LaunchServices
+# :: usage: python -m pytest scripts/test_keybindstate.py
+import json
+from argparse import Namespace
+
+import keybindstate
+from keybindstate import AdaptiveActivator, AppResolver, AppState, FakePlatform, SimulatedActivation
+
+FIREFOX = {"bundle_id": "org.mozilla.firefox", "path": "/Applications/Firefox.app"}
+
+
+def activate_n(activator: AdaptiveActivator, app: str, n: int) -> None:
+    for _ in range(n):
+        activator.activate(app)
+
+
+def test_untried_strategies_go_in_declaration_order():
+    sim = SimulatedActivation({"activate": {"*": 0.05}, "open": {"*": 0.2}})
+    activator = sim.activator()
+    assert activator.ranked("Firefox") == ["activate", "open"]
+    assert activator.activate("Firefox") == "activate"
+    assert sim.calls == [("activate", "Firefox")]
+
+
+def test_failed_strategy_falls_through_and_ranks_last():
+    sim = SimulatedActivation({"activate": {"Ghost": None, "*": 0.01}, "open": {"*": 0.2}})
+    activator = sim.activator()
+    assert activator.activate("Ghost") == "open"
+    assert sim.calls == [("activate", "Ghost"), ("open", "Ghost")]
+    assert activator.ranked("Ghost") == ["open", "activate"]
+    # other apps are ranked on their own measurements
+    assert activator.ranked("Firefox") == ["activate", "open"]
+
+
+def test_all_strategies_failing_returns_none():
+    sim = SimulatedActivation({"activate": {"*": None}, "open": {"*": None}})
+    activator = sim.activator()
+    assert activator.activate("Ghost") is None
+    assert activator.stats["Ghost"]["activations"] == 1
+
+
+def test_runner_up_is_remeasured_every_explore_every_activations():
+    sim = SimulatedActivation({"activate": {"*": 0.3}, "open": {"*": 0.1}})
+    activator = sim.activator()
+    activate_n(activator, "Firefox", AdaptiveActivator.EXPLORE_EVERY)
+    # never tried, so the faster strategy is only found by exploring
+    assert ("open", "Firefox") not in sim.calls
+    assert activator.ranked("Firefox") == ["open", "activate"]
+
+    assert activator.activate("Firefox") == "open"
+    assert activator.ranked("Firefox") == ["open", "activate"]
+    assert activator.activate("Firefox") == "open"
+
+
+def test_latency_is_a_moving_average():
+    sim = SimulatedActivation({"activate": {"*": 0.1}})
+    activator = sim.activator()
+    activator.activate("Firefox")
+    sim.latencies["activate"]["*"] = 0.2
+    activator.activate("Firefox")
+    entry = activator.stats["Firefox"]["strategies"]["activate"]
+    assert entry["ms"] == round(100 + AdaptiveActivator.ALPHA * 100, 3)
+    assert entry["runs"] == 2
+
+
+def test_stats_persist_between_activators(tmp_path):
+    path = tmp_path / "activation.json"
+    sim = SimulatedActivation({"activate": {"Ghost": None, "*": 0.01}, "open": {"*": 0.2}})
+    sim.activator(path).activate("Ghost")
+
+    assert json.loads(path.read_text())["Ghost"]["activations"] == 1
+    assert [p.name for p in tmp_path.iterdir()] == ["activation.json"]
+    assert sim.activator(path).ranked("Ghost") == ["open", "activate"]
+
+
+def test_corrupt_stats_start_empty(tmp_path):
+    path = tmp_path / "activation.json"
+    path.write_text("{not json")
+    sim = SimulatedActivation({"activate": {"*": 0.01}})
+    assert sim.activator(path).activate("Firefox") == "activate"
+
+
+def test_resolves_once_for_any_spelling(tmp_path):
+    platform = FakePlatform(installed={"Firefox": FIREFOX}, cache_path=tmp_path / "apps.json")
+    assert platform.canonical_name("firefox") == "Firefox"
+    assert platform.canonical_name("FIREFOX") == "Firefox"
+    assert platform.canonical_name("Firefox") == "Firefox"
+    assert platform.resolved == ["firefox"]
+    assert platform.resolver.lookup("firefox")["bundle_id"] == FIREFOX["bundle_id"]
+
+
+def test_cache_persists(tmp_path):
+    path = tmp_path / "apps.json"
+    FakePlatform(installed={"Firefox": FIREFOX}, cache_path=path).canonical_name("firefox")
+
+    platform = FakePlatform(installed={"Firefox": FIREFOX}, cache_path=path)
+    assert platform.canonical_name("firefox") == "Firefox"
+    assert platform.resolved == []
+    assert [p.name for p in tmp_path.iterdir()] == ["apps.json"]
+
+
+def test_misses_are_cached_until_ttl():
+    platform = FakePlatform(installed={})
+    now = 1000.0
+    platform.resolver.clock = lambda: now
+    assert platform.canonical_name("Nope") == "Nope"
+    assert platform.canonical_name("nope") == "nope"
+    assert platform.resolved == ["Nope"]
+
+    now += AppResolver.MISS_TTL + 1
+    platform.installed["Nope"] = {"bundle_id": "com.example.nope", "path": "/Applications/Nope.app"}
+    assert platform.canonical_name("nope") == "Nope"
+    assert platform.resolved == ["Nope", "nope"]
+
+
+def test_invalidate_forgets_every_spelling():
+    platform = FakePlatform(installed={"Firefox": FIREFOX})
+    platform.canonical_name("firefox")
+    platform.resolver.invalidate("FIREFOX")
+    assert platform.resolver.entries == {}
+
+    platform.installed["Firefox"] = {**FIREFOX, "path": "/Users/me/Applications/Firefox.app"}
+    assert platform.resolver.lookup("Firefox")["path"] == "/Users/me/Applications/Firefox.app"
+    assert platform.resolved == ["firefox", "Firefox"]
+
+
+def test_invalidate_all():
+    platform = FakePlatform(installed={"Firefox": FIREFOX})
+    platform.canonical_name("firefox")
+    platform.canonical_name("Nope")
+    platform.resolver.invalidate()
+    assert platform.resolver.entries == {}
+
+
+def test_canonical_names_match_existing_stack_entries(monkeypatch):
+    monkeypatch.setattr(keybindstate, "PLATFORM", FakePlatform(installed={"Firefox": FIREFOX}))
+    app_state = AppState(stack=["Safari", "firefox"], on_current_changed=lambda _: None)
+
+    keybindstate.cmd_switch(Namespace(app="firefox"), app_state)
+    assert list(app_state) == ["Safari", "Firefox"]
+    assert app_state.current_app == "Firefox"
+
+    keybindstate.cmd_remove(Namespace(app="firefox"), app_state)
+    assert list(app_state) == ["Safari"]